@@ -1,13 +1,22 @@
-import os
 import logging
-from typing import Optional
-from dotenv import load_dotenv
 
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+
+from dashboard.queries import (
+    avisar_falha_consulta,
+    consultar_fila_filtrada,
+    consultar_metricas,
+    consultar_versao_fila,
+    total_na_versao,
+)
+from dashboard.plots import (
+    LIMITE_PONTOS_PLOTLY,
+    construir_barras,
+    construir_mapa,
+    construir_mapa_deck,
+    construir_pizza,
+    preparar_painel,
+)
 
 # --- 1. CONFIGURAÇÃO DE LOGS ---
 logger = logging.getLogger("Dashboard_Regulacao")
@@ -16,102 +25,14 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 # --- 2. ESTÉTICA E CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(page_title="Monitor Regulação RJ", layout="wide", page_icon="📈")
 
-CORES_GRAVIDADE = {
-    "Vermelho": "#FF4B4B",
-    "Laranja": "#FFA500",
-    "Amarelo": "#F1C40F",
-    "Verde": "#2ECC71"
-}
-
-
-@st.cache_resource
-def iniciar_conexao() -> Optional[Engine]:
-    """Cria a conexão inicial (em cache) com o banco de dados via SQLAlchemy e psycopg2."""
-    load_dotenv()
-    db_url = os.getenv('SUPABASE_DB_URL') or os.getenv('DATABASE_URL')
-    
-    if not db_url:
-        st.error("⚠️ Configuração Incompleta: Variável 'SUPABASE_DB_URL' não encontrada.")
-        logger.error("A URL de conexão não foi inserida no .env ou nas Variáveis de Servidor.")
-        return None
-
-    if db_url.startswith('postgres://'):
-        db_url = db_url.replace('postgres://', 'postgresql+psycopg2://', 1)
-    
-    try:
-        engine = create_engine(db_url)
-        return engine
-    except Exception as e:
-        st.error("⚠️ Erro Crítico: Falha de comunicação com o Banco de Dados PostgreSQL.")
-        logger.error(f"Stack Trace de Banco: {e}")
-        return None
-
-
-@st.cache_data(ttl=60)
-def consultar_dados() -> pd.DataFrame:
-    """Extrai os dados unidos da fila e das unidades mestre."""
-    engine = iniciar_conexao()
-    if engine is None:
-        return pd.DataFrame()
-        
-    query =text("""
-    SELECT 
-        f.id_paciente, f.nome_anonimo, f.gravidade, f.procedimento_solicitado, 
-        f.unidade_origem, f.data_solicitacao,
-        u.cap, u.latitude, u.longitude 
-    FROM fila_regulacao f
-    LEFT JOIN unidades_saude u ON f.unidade_origem = u.nome_unidade
-    """)
-    
-    try:
-        with engine.connect() as conexao:
-             df = pd.read_sql(query, conexao)
-             
-        # Tratamento seguro da CAP do Rio
-        if 'cap' in df.columns:
-             df['cap'] = df['cap'].fillna('N/I').astype(str)
-        return df
-        
-    except Exception as e:
-        logger.error(f"Falha na consulta cruzada (JOIN) via SQLAlchemy: {e}")
-        st.warning("🔄 O banco de dados no momento não contém a tabela 'fila_regulacao'. Simule rodando os scripts Python de ETL primeiro.")
-        return pd.DataFrame()
-
-
-# --- INTERFACE PRINCIPAL ---
-def renderizar_dashboard():
-    df = consultar_dados()
-
-    st.title("🏥 Gestão de Fluxo por CAP - Regulação Rio")
-    st.markdown("Monitoramento avançado do fluxo de pacientes na fila do Sistema Único de Saúde (Rede Municipal/Estadual).")
-    st.markdown("---")
-
-    if df.empty:
-        st.info("Nenhuma fila ativa processada nesse instante pela Secretaria de Saúde. Aguardando a carga de dados do ETL.")
-        # Pode ter um botão manual para o cliente recarregar a visualização
-        if st.button("🔄 Ver novamente"):
-            st.cache_data.clear()
-            st.rerun()
-        return
-
-    # --- MÉTRICAS DE TOPO ---
-    c1, c2, c3, c4 = st.columns(4)
-    with c1:
-        st.metric("Total de Pacientes na Fila", f"{len(df):,}".replace(",", "."))
-    
-    with c2:
-        criticos = len(df[df['gravidade'] == 'Vermelho'])
-        st.metric("🔴 Alerta Máximo (Vermelho)", criticos)
-        
-    with c3:
-        cap_mais_lotada = df['cap'].value_counts().idxmax() if not df.empty else "N/A"
-        st.metric("📍 R. Administrativa em Alerta (CAP)", f"CAP {cap_mais_lotada}")
-        
-    with c4:
-        st.metric("Hospitais / Clínicas Restritas", df['unidade_origem'].nunique())
-
-    st.markdown("---")
 
+# --- PAINEL INTERATIVO (FRAGMENTO) ---
+@st.fragment
+def renderizar_painel_filtrado(lista_caps):
+    """
+    Filtros, mapa, gráficos e tabela. Como fragmento, mudar um filtro reexecuta apenas
+    este bloco, sem refazer o título, as métricas de topo e as consultas agregadas.
+    """
     # --- ÁREA INTERATIVA: MAPA E FILTROS ---
     colunas_mapa, colunas_info = st.columns([2, 1])
 
@@ -119,7 +40,6 @@ def renderizar_dashboard():
         st.subheader("🔍 Filtros Operacionais", divider='red')
         
         # Filtro de Regionais / CAPs
-        lista_caps = sorted(df['cap'].unique())
         caps_selecionadas = st.multiselect("Filtrar Administrativamente (CAPs):", options=lista_caps, default=lista_caps)
         
         # Filtro de Risco
@@ -129,24 +49,34 @@ def renderizar_dashboard():
             default=["Vermelho", "Laranja", "Amarelo", "Verde"]
         )
 
-        # Atualizando visualização (Slice)
-        df_filtrado = df[df['cap'].isin(caps_selecionadas) & df['gravidade'].isin(grav_selecionada)]
+        # Atualizando visualização (Slice): o filtro é aplicado no próprio Postgres.
+        # A chave ordenada faz seleções equivalentes reaproveitarem o mesmo cache.
+        # A versão da fila entra na chave: o cache só é refeito quando o ETL muda os dados.
+        # Falhas não entram no cache: o aviso aparece aqui e a próxima interação tenta de novo.
+        try:
+            filtros = (consultar_versao_fila(), tuple(sorted(caps_selecionadas)), tuple(sorted(grav_selecionada)))
+            df_filtrado = consultar_fila_filtrada(*filtros)
+        except Exception:
+            # O aviso de falha já explica a ausência do painel (não é uma seleção vazia)
+            avisar_falha_consulta()
+            return
+
+    # Filtros sem pacientes: nada a desenhar
+    if df_filtrado.empty:
+        with colunas_mapa:
+            st.subheader("📍 Distribuição Geográfica em Tempo Real", divider='red')
+            st.warning("⚠️ Nenhum paciente encontrado para as CAPs e classificações de risco selecionadas.")
+        return
 
     with colunas_mapa:
         st.subheader("📍 Distribuição Geográfica em Tempo Real", divider='red')
-        df_mapa = df_filtrado.dropna(subset=['latitude', 'longitude'])
+        # Acima do limite, os pontos já chegam agrupados por unidade para a camada WebGL
+        n_pontos, pontos_mapa, _ = preparar_painel(*filtros)
         
-        if not df_mapa.empty:
-            fig_mapa = px.scatter_mapbox(
-                df_mapa, lat="latitude", lon="longitude", 
-                color="gravidade", size_max=14, zoom=9.5,
-                hover_name="unidade_origem",
-                hover_data={"latitude": False, "longitude": False, "cap": True, "nome_anonimo": True, "procedimento_solicitado": True},
-                color_discrete_map=CORES_GRAVIDADE,
-                mapbox_style="carto-darkmatter"
-            )
-            fig_mapa.update_layout(margin={"r":0,"t":0,"l":0,"b":0}, height=450)
-            st.plotly_chart(fig_mapa, use_container_width=True)
+        if n_pontos > LIMITE_PONTOS_PLOTLY:
+            st.pydeck_chart(construir_mapa_deck(pontos_mapa), height=450)
+        elif n_pontos > 0:
+            st.plotly_chart(construir_mapa(*filtros), use_container_width=True)
         else:
             st.warning("⚠️ O mapa não pode ser exibido: As unidades não possuem licença ou coordenadas geospaciais catalogadas.")
 
@@ -156,20 +86,11 @@ def renderizar_dashboard():
 
     with graf_col_1:
         st.subheader("📊 Fila Bruta Por Coordenação (CAP)", divider="blue")
-        cap_dist = df_filtrado['cap'].value_counts().reset_index()
-        fig_barras = px.bar(cap_dist, x='cap', y='count', color='cap',
-                            labels={'count': 'Indivíduos na Fila', 'cap': 'Micro Área'}, 
-                            text='count')
-        fig_barras.update_traces(textposition='outside')
-        fig_barras.update_layout(showlegend=False, xaxis_title=None, yaxis_title="Pacientes")
-        st.plotly_chart(fig_barras, use_container_width=True)
+        st.plotly_chart(construir_barras(*filtros), use_container_width=True)
 
     with graf_col_2:
         st.subheader("⚖️ Mix da Sala Vermelha versus Protocolo", divider="blue")
-        fig_pizza = px.pie(df_filtrado, names='gravidade', color='gravidade', 
-                           color_discrete_map=CORES_GRAVIDADE, hole=0.55)
-        fig_pizza.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig_pizza, use_container_width=True)
+        st.plotly_chart(construir_pizza(*filtros), use_container_width=True)
 
     # --- TABELA LOGÍSTICA (DataGrid) ---
     st.subheader("📋 Logística Hospitalar - Visão do Prontuário Clínico", divider='green')
@@ -188,6 +109,57 @@ def renderizar_dashboard():
         }
     )
 
+
+# --- INTERFACE PRINCIPAL ---
+def renderizar_dashboard():
+    # Sonda barata (total e versão da view): com a fila vazia, nenhuma outra consulta é feita
+    try:
+        versao = consultar_versao_fila()
+    except Exception:
+        # Banco indisponível: não confundir com uma fila vazia
+        versao = None
+
+    st.title("🏥 Gestão de Fluxo por CAP - Regulação Rio")
+    st.markdown("Monitoramento avançado do fluxo de pacientes na fila do Sistema Único de Saúde (Rede Municipal/Estadual).")
+    st.markdown("---")
+
+    if versao is None:
+        avisar_falha_consulta()
+    elif total_na_versao(versao) == 0:
+        st.info("Nenhuma fila ativa processada nesse instante pela Secretaria de Saúde. Aguardando a carga de dados do ETL.")
+
+    if versao is None or total_na_versao(versao) == 0:
+        # Pode ter um botão manual para o cliente recarregar a visualização
+        if st.button("🔄 Ver novamente"):
+            st.cache_data.clear()
+            st.rerun()
+        return
+
+    try:
+        metricas = consultar_metricas(versao)
+    except Exception:
+        avisar_falha_consulta()
+        return
+
+    # --- MÉTRICAS DE TOPO ---
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        st.metric("Total de Pacientes na Fila", f"{int(metricas.at[0, 'total']):,}".replace(",", "."))
+    
+    with c2:
+        st.metric("🔴 Alerta Máximo (Vermelho)", int(metricas.at[0, 'criticos']))
+        
+    with c3:
+        cap_mais_lotada = metricas.at[0, 'cap_top'] or "N/A"
+        st.metric("📍 R. Administrativa em Alerta (CAP)", f"CAP {cap_mais_lotada}")
+        
+    with c4:
+        st.metric("Hospitais / Clínicas Restritas", int(metricas.at[0, 'unidades']))
+
+    st.markdown("---")
+
+    renderizar_painel_filtrado(list(metricas.at[0, 'caps']))
+
     # Fica um rodapé opcional interativo da sidebar apenas para forçar sync
     st.sidebar.title("⚙️ Painel de Operações")
     st.sidebar.info("A sincronização ocorre automaticamente no Postgres. Utilize o botão para um carregamento emergencial.")
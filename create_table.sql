@@ -8,3 +8,12 @@ CREATE TABLE IF NOT EXISTS public.fila_regulacao (
     unidade_origem text,
     data_solicitacao timestamp without time zone
 );
+
+-- Chaves de JOIN/filtro usadas pelas consultas do Dashboard
+CREATE INDEX IF NOT EXISTS ix_fila_unidade ON public.fila_regulacao (unidade_origem);
+CREATE INDEX IF NOT EXISTS ix_fila_gravidade ON public.fila_regulacao (gravidade);
+
+-- Chave natural da solicitação: as cargas usam INSERT ... ON CONFLICT DO NOTHING.
+-- NULLS NOT DISTINCT (PostgreSQL 15+): linhas sem data_solicitacao também conflitam entre cargas.
+CREATE UNIQUE INDEX IF NOT EXISTS ux_fila_paciente_data ON public.fila_regulacao (id_paciente, data_solicitacao)
+    NULLS NOT DISTINCT;
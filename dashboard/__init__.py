@@ -0,0 +1 @@
+"""Módulos do Dashboard de Regulação: consultas ao banco e construção dos gráficos."""
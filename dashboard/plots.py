@@ -0,0 +1,149 @@
+"""
+Construção dos gráficos do Dashboard (Plotly e pydeck).
+
+Cada figura fica em cache do Streamlit, chaveada pela versão da fila e pelas tuplas
+de filtros selecionados, e é montada a partir de `preparar_painel`: a fila filtrada de
+`dashboard.queries` é percorrida uma única vez por seleção.
+"""
+from typing import Optional, Tuple
+
+import streamlit as st
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import pydeck as pdk
+
+from dashboard.queries import TTL_SEGURANCA, consultar_fila_filtrada
+
+CORES_GRAVIDADE = {
+    "Vermelho": "#FF4B4B",
+    "Laranja": "#FFA500",
+    "Amarelo": "#F1C40F",
+    "Verde": "#2ECC71"
+}
+
+# Mesmas cores em RGB, no formato esperado pelas camadas do pydeck
+CORES_GRAVIDADE_RGB = {
+    gravidade: [int(cor[i:i + 2], 16) for i in (1, 3, 5)] for gravidade, cor in CORES_GRAVIDADE.items()
+}
+
+# Acima deste volume de pontos o mapa deixa o Plotly e passa para uma camada WebGL (pydeck)
+LIMITE_PONTOS_PLOTLY = 2000
+
+# Únicas colunas enviadas ao navegador pelo mapa; coordenadas com 5 casas (~1 m) bastam
+COLUNAS_MAPA = ['latitude', 'longitude', 'gravidade', 'cap', 'unidade_origem', 'nome_anonimo', 'procedimento_solicitado']
+CASAS_DECIMAIS_COORDENADAS = 5
+
+# Hover do mapa: só essas colunas viajam em `customdata` (sem cópias ocultas de lat/lon por ponto)
+COLUNAS_HOVER_MAPA = ['cap', 'nome_anonimo', 'procedimento_solicitado']
+TEMPLATE_HOVER_MAPA = "<b>%{hovertext}</b><br>CAP %{customdata[0]}<br>%{customdata[1]}<br>%{customdata[2]}"
+
+
+def _pontos_mapa(df_filtrado: pd.DataFrame) -> pd.DataFrame:
+    """Linhas filtradas da fila cujas unidades possuem coordenadas, só com as colunas usadas no mapa."""
+    df_mapa = df_filtrado.dropna(subset=['latitude', 'longitude'])[COLUNAS_MAPA].copy()
+    df_mapa[['latitude', 'longitude']] = df_mapa[['latitude', 'longitude']].round(CASAS_DECIMAIS_COORDENADAS)
+    return df_mapa
+
+
+def _agrupar_pontos_mapa(df_mapa: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrupa no servidor os pacientes por unidade e gravidade para o mapa de grande volume.
+    Todos os pacientes de uma unidade compartilham a mesma coordenada, então o navegador
+    recebe no máximo (unidades x gravidades) pontos, independente do tamanho da fila.
+    """
+    pontos = (
+        df_mapa
+        .groupby(['unidade_origem', 'cap', 'gravidade', 'latitude', 'longitude'], observed=True)
+        .size()
+        .reset_index(name='pacientes')
+    )
+    pontos['cor'] = pontos['gravidade'].astype(str).map(CORES_GRAVIDADE_RGB)
+    pontos['raio'] = np.sqrt(pontos['pacientes']) * 60
+    return pontos
+
+
+@st.cache_data(ttl=TTL_SEGURANCA)
+def preparar_painel(
+    versao: Tuple[str, ...], caps: Tuple[str, ...], gravidades: Tuple[str, ...]
+) -> Tuple[int, pd.DataFrame, pd.DataFrame]:
+    """
+    Única passagem sobre a fila filtrada por seleção, reaproveitada pelo mapa e pelos gráficos.
+    Retorna (pacientes no mapa, pontos do mapa, contagem por CAP e gravidade). Acima de
+    LIMITE_PONTOS_PLOTLY os pontos já vêm agrupados por unidade (`_agrupar_pontos_mapa`),
+    assim o cache guarda apenas tabelas pequenas, e não uma nova cópia da fila inteira.
+    """
+    df_filtrado = consultar_fila_filtrada(versao, caps, gravidades)
+
+    df_mapa = _pontos_mapa(df_filtrado)
+    n_pontos = len(df_mapa)
+    if n_pontos > LIMITE_PONTOS_PLOTLY:
+        df_mapa = _agrupar_pontos_mapa(df_mapa)
+
+    # Contagem única por (CAP, gravidade), base dos gráficos de barras e pizza
+    contagem = df_filtrado.groupby(['cap', 'gravidade'], observed=True).size().reset_index(name='count')
+    return n_pontos, df_mapa, contagem
+
+
+@st.cache_data(ttl=TTL_SEGURANCA)
+def construir_mapa(versao: Tuple[str, ...], caps: Tuple[str, ...], gravidades: Tuple[str, ...]) -> Optional[go.Figure]:
+    """Monta o mapa de pacientes; retorna None quando nenhuma unidade filtrada possui coordenadas."""
+    _, df_mapa, _ = preparar_painel(versao, caps, gravidades)
+    if df_mapa.empty:
+        return None
+
+    fig_mapa = px.scatter_mapbox(
+        df_mapa, lat="latitude", lon="longitude", 
+        color="gravidade", size_max=14, zoom=9.5,
+        hover_name="unidade_origem",
+        custom_data=COLUNAS_HOVER_MAPA,
+        color_discrete_map=CORES_GRAVIDADE,
+        mapbox_style="carto-darkmatter"
+    )
+    fig_mapa.update_traces(hovertemplate=TEMPLATE_HOVER_MAPA)
+    fig_mapa.update_layout(margin={"r":0,"t":0,"l":0,"b":0}, height=450)
+    return fig_mapa
+
+
+def construir_mapa_deck(pontos: pd.DataFrame) -> pdk.Deck:
+    """Mapa WebGL (pydeck ScatterplotLayer) para volumes acima de LIMITE_PONTOS_PLOTLY."""
+    camada = pdk.Layer(
+        "ScatterplotLayer", pontos,
+        get_position=["longitude", "latitude"], get_fill_color="cor", get_radius="raio",
+        radius_min_pixels=3, opacity=0.7, pickable=True
+    )
+    vista = pdk.ViewState(latitude=pontos['latitude'].mean(), longitude=pontos['longitude'].mean(), zoom=9.5)
+    return pdk.Deck(
+        layers=[camada], initial_view_state=vista, map_style="dark",
+        tooltip={"text": "{unidade_origem}\nCAP {cap} - {gravidade}: {pacientes} paciente(s)"}
+    )
+
+
+@st.cache_data(ttl=TTL_SEGURANCA)
+def construir_barras(versao: Tuple[str, ...], caps: Tuple[str, ...], gravidades: Tuple[str, ...]) -> go.Figure:
+    """Gráfico de barras com o volume da fila por CAP."""
+    _, _, contagem = preparar_painel(versao, caps, gravidades)
+    cap_dist = (
+        contagem
+        .groupby('cap', observed=True)['count'].sum()
+        .sort_values(ascending=False)
+        .reset_index()
+    )
+    fig_barras = px.bar(cap_dist, x='cap', y='count', color='cap',
+                        labels={'count': 'Indivíduos na Fila', 'cap': 'Micro Área'}, 
+                        text='count')
+    fig_barras.update_traces(textposition='outside')
+    fig_barras.update_layout(showlegend=False, xaxis_title=None, yaxis_title="Pacientes")
+    return fig_barras
+
+
+@st.cache_data(ttl=TTL_SEGURANCA)
+def construir_pizza(versao: Tuple[str, ...], caps: Tuple[str, ...], gravidades: Tuple[str, ...]) -> go.Figure:
+    """Gráfico de rosca com a proporção de cada classificação de risco."""
+    _, _, contagem = preparar_painel(versao, caps, gravidades)
+    grav_dist = contagem.groupby('gravidade', observed=True)['count'].sum().reset_index()
+    fig_pizza = px.pie(grav_dist, names='gravidade', values='count', color='gravidade', 
+                       color_discrete_map=CORES_GRAVIDADE, hole=0.55)
+    fig_pizza.update_traces(textposition='inside', textinfo='percent+label')
+    return fig_pizza
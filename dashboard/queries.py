@@ -0,0 +1,143 @@
+"""
+Consultas do Dashboard ao PostgreSQL.
+
+As agregações rodam no banco; apenas as linhas já filtradas por CAP/gravidade
+chegam ao pandas. Todas as funções públicas ficam em cache do Streamlit, chaveadas
+pela versão da fila (`consultar_versao_fila`): o cache só é refeito quando o ETL
+altera os dados, e não a cada intervalo fixo.
+"""
+import logging
+from typing import Optional, Tuple
+
+import streamlit as st
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from scripts.banco import obter_engine, obter_url_banco
+
+logger = logging.getLogger("Dashboard_Regulacao")
+
+# Tamanho dos blocos lidos pelo cursor server-side ao buscar as linhas da fila
+LOTE_LEITURA = 20_000
+
+# A versão da fila é checada com frequência (consulta barata); as demais consultas só
+# expiram sozinhas após TTL_SEGURANCA, para alterações feitas no banco fora dos scripts de ETL.
+TTL_VERSAO = 15
+TTL_SEGURANCA = 600
+
+# Colunas de baixa cardinalidade: convertidas para Categorical logo após a consulta
+COLUNAS_CATEGORICAS = ('gravidade', 'cap', 'procedimento_solicitado', 'unidade_origem')
+
+
+@st.cache_resource
+def iniciar_conexao() -> Optional[Engine]:
+    """Cria a conexão inicial (em cache) com o banco de dados, reaproveitando a Engine com pool dos scripts de ETL."""
+    db_url = obter_url_banco()
+    
+    if not db_url:
+        st.error("⚠️ Configuração Incompleta: Variável 'SUPABASE_DB_URL' não encontrada.")
+        logger.error("A URL de conexão não foi inserida no .env ou nas Variáveis de Servidor.")
+        return None
+
+    try:
+        # Pool compartilhado entre as sessões do Streamlit (a função fica em cache_resource)
+        return obter_engine(db_url)
+    except Exception as e:
+        st.error("⚠️ Erro Crítico: Falha de comunicação com o Banco de Dados PostgreSQL.")
+        logger.error(f"Stack Trace de Banco: {e}")
+        return None
+
+
+# Todas as consultas leem a view materializada `fila_enriquecida`, atualizada pelo ETL: a fila
+# já vem cruzada com o cadastro das unidades (CAP normalizada e coordenadas), sem JOIN por acesso.
+FILA_ENRIQUECIDA = "fila_enriquecida"
+
+
+def _ler_sql(query: str, lote: Optional[int] = None, **parametros) -> pd.DataFrame:
+    """
+    Executa uma consulta no banco e devolve o resultado como DataFrame.
+    Com `lote`, as linhas chegam por um cursor no servidor, em blocos desse tamanho.
+
+    Falhas são registradas e repassadas (não viram DataFrame vazio): o `st.cache_data` não
+    guarda exceções, então uma queda momentânea do banco não fica em cache por TTL_SEGURANCA.
+    Quem chama as consultas em cache trata o erro com `avisar_falha_consulta`.
+    """
+    engine = iniciar_conexao()
+    if engine is None:
+        raise RuntimeError("Conexão com o banco de dados indisponível.")
+
+    try:
+        with engine.connect() as conexao:
+            if lote is None:
+                return pd.read_sql(text(query), conexao, params=parametros or None)
+
+            # stream_results abre um cursor nomeado (server-side) no psycopg: o driver não
+            # materializa o resultado inteiro em memória antes de o pandas montar os blocos.
+            conexao = conexao.execution_options(stream_results=True)
+            blocos = pd.read_sql(text(query), conexao, params=parametros or None, chunksize=lote)
+            return pd.concat(blocos, ignore_index=True)
+    except Exception as e:
+        logger.error(f"Falha na consulta da fila enriquecida via SQLAlchemy: {e}")
+        raise
+
+
+def avisar_falha_consulta() -> None:
+    """Aviso exibido no Dashboard quando uma consulta ao banco falha (fora das funções em cache)."""
+    st.warning("🔄 O banco de dados no momento não contém a view 'fila_enriquecida'. Simule rodando os scripts Python de ETL primeiro.")
+
+
+@st.cache_data(ttl=TTL_VERSAO)
+def consultar_versao_fila() -> Tuple[str, ...]:
+    """
+    Identifica o estado atual da fila: total de linhas e a versão da view, incrementada pelo
+    ETL a cada REFRESH (`fila_enriquecida_versao`), inclusive em upserts e em trocas de CAP e
+    coordenadas das unidades. Passada como argumento às demais consultas, invalida seus caches.
+    """
+    df = _ler_sql(f"""
+    SELECT
+        (SELECT count(*) FROM {FILA_ENRIQUECIDA}) AS total,
+        v.versao, v.atualizada_em
+    FROM (SELECT 1) AS sonda
+    LEFT JOIN public.fila_enriquecida_versao v ON true
+    """)
+    return tuple(str(valor) for valor in df.iloc[0]) if not df.empty else ()
+
+
+def total_na_versao(versao: Tuple[str, ...]) -> int:
+    """Total de linhas da fila segundo a versão (0 quando a fila está vazia)."""
+    return int(versao[0]) if versao else 0
+
+
+@st.cache_data(ttl=TTL_SEGURANCA)
+def consultar_metricas(versao: Tuple[str, ...]) -> pd.DataFrame:
+    """
+    Retorna em uma única linha (uma só ida ao banco) as métricas de topo e a lista de CAPs
+    do filtro: total, críticos (Vermelho), unidades distintas, CAP mais lotada e CAPs.
+    """
+    return _ler_sql(f"""
+    SELECT
+        count(*) AS total,
+        count(*) FILTER (WHERE f.gravidade = 'Vermelho') AS criticos,
+        count(DISTINCT f.unidade_origem) AS unidades,
+        (SELECT t.cap FROM {FILA_ENRIQUECIDA} t GROUP BY t.cap ORDER BY count(*) DESC, t.cap LIMIT 1) AS cap_top,
+        array_agg(DISTINCT f.cap ORDER BY f.cap) AS caps
+    FROM {FILA_ENRIQUECIDA} f
+    """)
+
+
+@st.cache_data(ttl=TTL_SEGURANCA)
+def consultar_fila_filtrada(versao: Tuple[str, ...], caps: Tuple[str, ...], gravidades: Tuple[str, ...]) -> pd.DataFrame:
+    """Busca as linhas individuais da fila apenas para as CAPs e gravidades selecionadas."""
+    df = _ler_sql(f"""
+    SELECT 
+        f.id_paciente, f.nome_anonimo, f.gravidade, f.procedimento_solicitado, 
+        f.unidade_origem, f.data_solicitacao, f.cap, f.latitude, f.longitude
+    FROM {FILA_ENRIQUECIDA} f
+    WHERE f.cap = ANY(:caps) AND f.gravidade = ANY(:gravidades)
+    """, lote=LOTE_LEITURA, caps=list(caps), gravidades=list(gravidades))
+
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype('category')
+    return df
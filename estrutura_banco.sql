@@ -7,17 +7,27 @@ CREATE TABLE IF NOT EXISTS public.fila_regulacao (
     unidade_origem text,
     data_solicitacao timestamp without time zone
 );
+
+-- Chaves de JOIN/filtro usadas pelas consultas do Dashboard
+CREATE INDEX IF NOT EXISTS ix_fila_unidade ON public.fila_regulacao (unidade_origem);
+CREATE INDEX IF NOT EXISTS ix_fila_gravidade ON public.fila_regulacao (gravidade);
+
+-- Chave natural da solicitação: as cargas usam INSERT ... ON CONFLICT DO NOTHING.
+-- NULLS NOT DISTINCT (PostgreSQL 15+): linhas sem data_solicitacao também conflitam entre cargas.
+CREATE UNIQUE INDEX IF NOT EXISTS ux_fila_paciente_data ON public.fila_regulacao (id_paciente, data_solicitacao)
+    NULLS NOT DISTINCT;
+
 CREATE TABLE unidades_saude (
     objectid INTEGER,
     globalid TEXT,
     cnes TEXT PRIMARY KEY,
-    nome_unidade TEXT,
+    nome_unidade TEXT NOT NULL UNIQUE, -- chave do JOIN com a fila (1:N)
     tipo TEXT,
     tipo_abc TEXT,
     endereco TEXT,
     bairro TEXT,
     municipio TEXT DEFAULT 'Rio de Janeiro',
-    cap TEXT,
+    cap TEXT NOT NULL DEFAULT 'N/I', -- 'N/I' = CAP não informada
     equipes TEXT,
     telefone TEXT,
     email TEXT,
@@ -29,4 +39,28 @@ CREATE TABLE unidades_saude (
     longitude FLOAT
 );
 
+CREATE INDEX IF NOT EXISTS ix_unidades_saude_cap ON unidades_saude (cap);
+
+-- Fila já cruzada com as unidades, lida pelo Dashboard sem JOIN.
+-- Atualizada pelos scripts de ETL com REFRESH MATERIALIZED VIEW CONCURRENTLY (exige o índice único).
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.fila_enriquecida AS
+SELECT
+    f.id, f.id_paciente, f.nome_anonimo, f.gravidade, f.procedimento_solicitado,
+    f.unidade_origem, f.data_solicitacao,
+    COALESCE(u.cap, 'N/I') AS cap, u.latitude, u.longitude
+FROM public.fila_regulacao f
+LEFT JOIN public.unidades_saude u ON f.unidade_origem = u.nome_unidade;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_fila_enriquecida_id ON public.fila_enriquecida (id);
+CREATE INDEX IF NOT EXISTS ix_fila_enriquecida_cap ON public.fila_enriquecida (cap);
+CREATE INDEX IF NOT EXISTS ix_fila_enriquecida_gravidade ON public.fila_enriquecida (gravidade);
+
+-- Versão da view (chave de cache do Dashboard), incrementada pelos scripts de ETL a cada REFRESH.
+CREATE TABLE IF NOT EXISTS public.fila_enriquecida_versao (
+    id smallint PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    versao bigint NOT NULL,
+    atualizada_em timestamptz NOT NULL DEFAULT now()
+);
+INSERT INTO public.fila_enriquecida_versao (id, versao) VALUES (1, 1) ON CONFLICT (id) DO NOTHING;
+
 SELECT tipo, count(*) FROM unidades_saude GROUP BY tipo ORDER BY count(*) DESC; 
@@ -0,0 +1 @@
+"""Scripts do ETL de Regulação: carga das unidades, geração da fila e acesso ao banco (executar com ``python -m scripts.<nome>``)."""
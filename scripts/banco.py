@@ -0,0 +1,293 @@
+"""
+Utilitários de conexão com o PostgreSQL compartilhados pelos scripts de ETL.
+
+Centraliza a leitura da URL do banco (.env), o ajuste do driver do SQLAlchemy e
+mantém uma única Engine (com pool de conexões) por processo.
+"""
+import io
+import os
+import logging
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger("Banco_Dados")
+
+# Pool de conexões reaproveitado entre as cargas: evita um novo handshake TCP+TLS
+# com o Supabase a cada operação e descarta conexões derrubadas pelo Pooler.
+CONFIG_POOL: dict = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+}
+
+# psycopg 3 passa a usar prepared statements no servidor a partir da N-ésima execução de uma
+# mesma consulta. O Pooler do Supabase em modo transação (porta 6543) não mantém prepared
+# statements entre transações, então nessa porta eles ficam desligados.
+PREPARE_THRESHOLD = 5
+PORTA_POOLER_TRANSACAO = 6543
+
+# Keepalive TCP nas conexões do pool: conexões ociosas não são derrubadas silenciosamente
+# por NAT/Pooler entre uma etapa e outra da carga.
+CONFIG_KEEPALIVE: dict = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 5,
+}
+
+# Tamanho (caracteres) de cada trecho do buffer CSV enviado ao COPY: o lote segue para o
+# servidor em partes, sem uma segunda cópia do texto inteiro em memória.
+TAMANHO_BLOCO_COPY = 1 << 20
+
+# Coluna auxiliar da tabela temporária de carga com a ordem de chegada das linhas
+COLUNA_ORDEM_CARGA = "_ordem_carga"
+
+# Estrutura da fila de regulação. A chave única (id_paciente, data_solicitacao) deixa a
+# deduplicação das cargas com o Postgres; na primeira vez, repetições já gravadas são
+# removidas para que o índice único possa ser criado. NULLS NOT DISTINCT (PostgreSQL 15+):
+# solicitações sem data válida (NaT na transformação) também conflitam entre cargas, assim
+# como já são agrupadas pelo DISTINCT ON da carga, e uma nova execução não as duplica.
+DDL_FILA_REGULACAO = """
+CREATE TABLE IF NOT EXISTS public.fila_regulacao (
+    id bigserial PRIMARY KEY,
+    id_paciente integer NOT NULL,
+    nome_anonimo text,
+    gravidade text,
+    procedimento_solicitado text,
+    unidade_origem text,
+    data_solicitacao timestamp without time zone
+);
+-- Chaves de JOIN/filtro usadas pelas consultas do Dashboard
+CREATE INDEX IF NOT EXISTS ix_fila_unidade ON public.fila_regulacao (unidade_origem);
+CREATE INDEX IF NOT EXISTS ix_fila_gravidade ON public.fila_regulacao (gravidade);
+
+DO $$
+BEGIN
+    -- Índice antigo (sem NULLS NOT DISTINCT): recriado abaixo
+    IF to_regclass('public.ux_fila_paciente_data') IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM pg_index
+        WHERE indexrelid = to_regclass('public.ux_fila_paciente_data') AND indnullsnotdistinct
+    ) THEN
+        DROP INDEX public.ux_fila_paciente_data;
+    END IF;
+
+    IF to_regclass('public.ux_fila_paciente_data') IS NULL THEN
+        DELETE FROM public.fila_regulacao
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (PARTITION BY id_paciente, data_solicitacao ORDER BY id) AS ordem
+                FROM public.fila_regulacao
+            ) repetidas
+            WHERE ordem > 1
+        );
+
+        CREATE UNIQUE INDEX ux_fila_paciente_data ON public.fila_regulacao (id_paciente, data_solicitacao)
+            NULLS NOT DISTINCT;
+    END IF;
+END $$;
+"""
+
+# Fila já cruzada com o cadastro das unidades (CAP e coordenadas), lida pelo Dashboard sem
+# JOIN. O índice único em `id` é exigido pelo REFRESH ... CONCURRENTLY, que atualiza a view
+# sem bloquear as leituras em andamento.
+DDL_FILA_ENRIQUECIDA = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.fila_enriquecida AS
+SELECT
+    f.id, f.id_paciente, f.nome_anonimo, f.gravidade, f.procedimento_solicitado,
+    f.unidade_origem, f.data_solicitacao,
+    COALESCE(u.cap, 'N/I') AS cap, u.latitude, u.longitude
+FROM public.fila_regulacao f
+LEFT JOIN public.unidades_saude u ON f.unidade_origem = u.nome_unidade;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_fila_enriquecida_id ON public.fila_enriquecida (id);
+CREATE INDEX IF NOT EXISTS ix_fila_enriquecida_cap ON public.fila_enriquecida (cap);
+CREATE INDEX IF NOT EXISTS ix_fila_enriquecida_gravidade ON public.fila_enriquecida (gravidade);
+"""
+
+# Versão da view `fila_enriquecida`, incrementada a cada criação/REFRESH (na mesma transação).
+# É a chave de cache do Dashboard: muda com qualquer carga (inserção, upsert ou troca de CAP e
+# coordenadas das unidades), mesmo quando total e último id da fila continuam iguais.
+DDL_VERSAO_FILA_ENRIQUECIDA = """
+CREATE TABLE IF NOT EXISTS public.fila_enriquecida_versao (
+    id smallint PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    versao bigint NOT NULL,
+    atualizada_em timestamptz NOT NULL DEFAULT now()
+);
+INSERT INTO public.fila_enriquecida_versao (id, versao) VALUES (1, 1)
+ON CONFLICT (id) DO UPDATE
+SET versao = fila_enriquecida_versao.versao + 1, atualizada_em = now();
+"""
+
+
+def obter_url_banco() -> Optional[str]:
+    """Carrega o .env e devolve a URL do banco (Supabase ou PostgreSQL local)."""
+    load_dotenv()
+    return os.getenv("SUPABASE_DB_URL") or os.getenv("DATABASE_URL")
+
+
+def ajustar_url_sqlalchemy(db_url: str) -> str:
+    """
+    Formata a string de conexão para que o SQLAlchemy utilize o driver psycopg (v3) corretamente.
+    """
+    if db_url.startswith("postgres://"):
+        return db_url.replace("postgres://", "postgresql+psycopg://", 1)
+    if db_url.startswith("postgresql://"):
+        return db_url.replace("postgresql://", "postgresql+psycopg://", 1)
+    return db_url
+
+
+def argumentos_conexao(db_url: str) -> dict:
+    """Parâmetros repassados ao psycopg em cada nova conexão do pool."""
+    em_pooler_transacao = make_url(db_url).port == PORTA_POOLER_TRANSACAO
+    return {"prepare_threshold": None if em_pooler_transacao else PREPARE_THRESHOLD, **CONFIG_KEEPALIVE}
+
+
+@lru_cache(maxsize=None)
+def obter_engine(db_url: str) -> Engine:
+    """
+    Cria a Engine do SQLAlchemy uma única vez por URL e a reaproveita nas chamadas seguintes.
+    """
+    try:
+        url_formatada = ajustar_url_sqlalchemy(db_url)
+        return create_engine(url_formatada, connect_args=argumentos_conexao(url_formatada), **CONFIG_POOL)
+    except Exception as e:
+        logger.critical(f"Falha ao criar a engine de conexão com o banco de dados: {e}")
+        raise
+
+
+def _copiar_csv(conn: Any, nome_tabela: str, colunas: List[str], buffer: io.StringIO) -> int:
+    """Envia um buffer CSV (sem cabeçalho) para a tabela via `COPY ... FROM STDIN`."""
+    lista_colunas = ", ".join(f'"{coluna}"' for coluna in colunas)
+    with conn.connection.cursor() as cursor:
+        with cursor.copy(f"COPY {nome_tabela} ({lista_colunas}) FROM STDIN WITH (FORMAT CSV)") as copia:
+            buffer.seek(0)
+            while bloco := buffer.read(TAMANHO_BLOCO_COPY):
+                copia.write(bloco)
+        return cursor.rowcount
+
+
+def copiar_via_copy(tabela: Any, conn: Any, colunas: List[str], linhas: Iterable[tuple]) -> int:
+    """
+    Método de inserção para `DataFrame.to_sql(method=...)` que envia os dados com o
+    `COPY ... FROM STDIN` do PostgreSQL, bem mais rápido que INSERTs com múltiplos VALUES.
+    Cada linha é adaptada pelo próprio psycopg (`write_row`), sem passar por texto CSV.
+    """
+    nome_tabela = f"{tabela.schema}.{tabela.name}" if tabela.schema else tabela.name
+    lista_colunas = ", ".join(f'"{coluna}"' for coluna in colunas)
+    with conn.connection.cursor() as cursor:
+        with cursor.copy(f"COPY {nome_tabela} ({lista_colunas}) FROM STDIN") as copia:
+            for linha in linhas:
+                copia.write_row(linha)
+        return cursor.rowcount
+
+
+def desativar_commit_sincrono(conn: Connection) -> None:
+    """
+    Desliga o `synchronous_commit` apenas na transação atual (`SET LOCAL`) de uma carga em massa:
+    o COMMIT não espera o flush do WAL em disco. Numa queda do servidor, só as últimas cargas
+    confirmadas podem se perder (sem corromper dados), e as cargas podem ser refeitas sem duplicar.
+    """
+    conn.execute(text("SET LOCAL synchronous_commit = off"))
+
+
+def garantir_tabela_fila(conn: Connection) -> None:
+    """
+    Cria (se preciso) a tabela `fila_regulacao` com seus índices e a chave natural única
+    (id_paciente, data_solicitacao) usada para deduplicar as cargas no próprio banco.
+    """
+    conn.execute(text(DDL_FILA_REGULACAO))
+
+
+def inserir_lotes_sem_duplicatas(
+    lotes: Iterable[pd.DataFrame],
+    nome_tabela: str,
+    chave: List[str],
+    conn: Connection,
+) -> Tuple[int, int]:
+    """
+    Carrega cada DataFrame de `lotes` via COPY em uma tabela temporária (um lote por vez na
+    memória) e transfere tudo para `nome_tabela` com `INSERT ... SELECT DISTINCT ON (chave)
+    ... ON CONFLICT DO NOTHING`: repetições do arquivo (prevalece a última linha recebida, pela
+    ordem de chegada no COPY) e registros já gravados em cargas anteriores são descartados
+    pelo Postgres. Deve ser chamada dentro de uma transação (`engine.begin()`).
+    Retorna (linhas recebidas, linhas inseridas).
+    """
+    tabela_carga = f"_carga_{nome_tabela}"
+    colunas: List[str] = []
+    recebidas = 0
+
+    for lote in lotes:
+        if not colunas:
+            colunas = list(lote.columns)
+            lista_colunas = ", ".join(f'"{coluna}"' for coluna in colunas)
+            conn.execute(text(
+                f"CREATE TEMP TABLE {tabela_carga} ON COMMIT DROP AS "
+                f"SELECT {lista_colunas} FROM {nome_tabela} WITH NO DATA"
+            ))
+            # Preenchida pelo próprio COPY, na ordem em que as linhas chegam (lote após lote)
+            conn.execute(text(
+                f"ALTER TABLE {tabela_carga} ADD COLUMN {COLUNA_ORDEM_CARGA} bigint GENERATED ALWAYS AS IDENTITY"
+            ))
+
+        buffer = io.StringIO()
+        lote.to_csv(buffer, index=False, header=False)
+        _copiar_csv(conn, tabela_carga, colunas, buffer)
+        recebidas += len(lote)
+
+    if not colunas:
+        return 0, 0
+
+    lista_chave = ", ".join(f'"{coluna}"' for coluna in chave)
+
+    resultado = conn.execute(text(f"""
+        INSERT INTO {nome_tabela} ({lista_colunas})
+        SELECT DISTINCT ON ({lista_chave}) {lista_colunas} FROM {tabela_carga}
+        ORDER BY {lista_chave}, {COLUNA_ORDEM_CARGA} DESC
+        ON CONFLICT ({lista_chave}) DO NOTHING
+    """))
+    return recebidas, resultado.rowcount
+
+
+def inserir_sem_duplicatas(
+    df: pd.DataFrame,
+    nome_tabela: str,
+    chave: List[str],
+    conn: Connection,
+) -> int:
+    """
+    Versão de `inserir_lotes_sem_duplicatas` para um único DataFrame.
+    Retorna as linhas inseridas.
+    """
+    return inserir_lotes_sem_duplicatas([df], nome_tabela, chave, conn)[1]
+
+
+def existe_relacao(conn: Connection, nome: str) -> bool:
+    """Indica se a tabela/view `nome` existe no banco."""
+    return conn.execute(text("SELECT to_regclass(:nome) IS NOT NULL"), {"nome": nome}).scalar()
+
+
+def atualizar_fila_enriquecida(conn: Connection, criar: bool = True) -> bool:
+    """
+    Atualiza a view materializada `fila_enriquecida` lida pelo Dashboard, criando-a antes
+    (com `criar=True`) caso ainda não exista. Requer `fila_regulacao` e `unidades_saude`.
+    Incrementa também `fila_enriquecida_versao`, que invalida o cache do Dashboard.
+    Retorna se a view foi criada ou atualizada.
+    """
+    if existe_relacao(conn, "public.fila_enriquecida"):
+        conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY public.fila_enriquecida"))
+    elif not criar:
+        return False
+    elif not existe_relacao(conn, "public.unidades_saude"):
+        logger.warning("Tabela 'unidades_saude' não encontrada: a view 'fila_enriquecida' não foi criada.")
+        return False
+    else:
+        conn.execute(text(DDL_FILA_ENRIQUECIDA))
+
+    conn.execute(text(DDL_VERSAO_FILA_ENRIQUECIDA))
+    return True
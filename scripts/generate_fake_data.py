@@ -1,12 +1,18 @@
-import pandas as pd
-import random
-import os
 import logging
-from datetime import datetime, timedelta
 from typing import List
 
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from scripts.banco import (
+    atualizar_fila_enriquecida,
+    desativar_commit_sincrono,
+    garantir_tabela_fila,
+    inserir_sem_duplicatas,
+    obter_engine,
+    obter_url_banco,
+)
 
 # --- CONFIGURAÇÃO DE LOGS ---
 logging.basicConfig(
@@ -16,24 +22,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger("Criador_Dados_Falsos")
 
-def obter_engine() -> create_engine:
-    """Carrega as variáveis e disponibiliza a conexão com o PostgreSQL"""
-    load_dotenv()
-    db_url = os.getenv('SUPABASE_DB_URL') or os.getenv('DATABASE_URL')
-    
-    if not db_url:
-        logger.critical("Variável de ambiente SUPABASE_DB_URL não encontrada. Certifique-se de configurar o arquivo .env.")
-        raise ValueError("URL de banco de dados inexistente.")
-
-    if db_url.startswith('postgres://'):
-        db_url = db_url.replace('postgres://', 'postgresql+psycopg2://', 1)
-    
-    try:
-        engine = create_engine(db_url)
-        return engine
-    except Exception as erro_conexao:
-         logger.critical(f"Falha na formatação com a API SQLAlchemy: {erro_conexao}")
-         raise
+# Janela da fila de demonstração: as ocorrências são sorteadas nos últimos dias e as
+# mais antigas que isso são removidas a cada nova rodada.
+JANELA_DIAS = 6
+CHAVE_FILA = ['id_paciente', 'data_solicitacao']
 
 def gerar_fila_ficticia(n_registros: int = 350) -> None:
     """
@@ -42,10 +34,11 @@ def gerar_fila_ficticia(n_registros: int = 350) -> None:
     """
     logger.info("Buscando lista de unidades válidas para o cruzamento Relacional (JOINs)...")
     
-    try:
-        engine = obter_engine()
-    except ValueError as val_error:
+    db_url = obter_url_banco()
+    if not db_url:
+        logger.critical("Variável de ambiente SUPABASE_DB_URL não encontrada. Certifique-se de configurar o arquivo .env.")
         return
+    engine = obter_engine(db_url)
 
     # Busca as descrições literais para inserção em fila_regulacao
     query_unidades = text("SELECT nome_unidade FROM public.unidades_saude")
@@ -70,36 +63,51 @@ def gerar_fila_ficticia(n_registros: int = 350) -> None:
         'Internação Pediátrica', 'Transferência para Especialidade', 'Resolução de Fratura (Ortopedia/Trauma)'
     ]
     
-    dados_compilados = []
+    # Sorteia cada coluna inteira de uma vez com o gerador do NumPy (sem laço Python por registro)
+    rng = np.random.default_rng()
     # Usaremos um pacote fixo de Letras do Alfabeto
-    alfabeto = 'ABCDEFGHIJKLMNOPRSTUVZ'
-    for _ in range(n_registros):
-        # Gera nome com iniciais aleatórias - mantendo LGPD Fake (Ex: A.J.P)
-        init = f"{random.choice(alfabeto)}.{random.choice(alfabeto)}."
-        
-        # Sorteia uma ocorrência de até 5 dias inteiros passados.
-        data_aleatoria = datetime.now() - timedelta(days=random.randint(0, 5), hours=random.randint(0, 23))
-        
-        dados_compilados.append({
-            "id_paciente": random.randint(10000, 99999),
-            "nome_anonimo": init,
-            "gravidade": random.choice(lista_gravidades),
-            "procedimento_solicitado": random.choice(lista_procedimentos),
-            "unidade_origem": random.choice(unidades_banco), # Match Exato para o Inner Join local Funcionar.
-            "data_solicitacao": data_aleatoria
-        })
+    alfabeto = np.array(list('ABCDEFGHIJKLMNOPRSTUVZ'))
+
+    # Gera nome com iniciais aleatórias - mantendo LGPD Fake (Ex: A.J.)
+    iniciais = np.char.add(
+        np.char.add(rng.choice(alfabeto, n_registros), "."),
+        np.char.add(rng.choice(alfabeto, n_registros), "."),
+    )
+
+    # Sorteia uma ocorrência de até 5 dias inteiros passados (dias + horas).
+    # O mesmo relógio local define os horários e o limite da janela removida abaixo
+    # (a coluna é timestamp sem fuso; o now() do servidor pode estar em outro fuso).
+    agora = pd.Timestamp.now()
+    horas_atras = rng.integers(0, JANELA_DIAS, n_registros) * 24 + rng.integers(0, 24, n_registros)
 
-    df_fake = pd.DataFrame(dados_compilados)
+    df_fake = pd.DataFrame({
+        "id_paciente": rng.integers(10000, 100000, n_registros, dtype=np.int32),
+        "nome_anonimo": iniciais,
+        "gravidade": rng.choice(lista_gravidades, n_registros),
+        "procedimento_solicitado": rng.choice(lista_procedimentos, n_registros),
+        "unidade_origem": rng.choice(unidades_banco, n_registros), # Match Exato para o Inner Join local Funcionar.
+        "data_solicitacao": agora - pd.to_timedelta(horas_atras, unit="h"),
+    })
 
     logger.info("Sintetizador: Submetendo a Fila nova ao Serviço de Banco de Dados...")
     try:
          with engine.begin() as conn:
-             # TRUNCATE esvazia a fila para demonstração ficar Clean.
-             conn.execute(text("TRUNCATE TABLE fila_regulacao RESTART IDENTITY;"))
-             # Executa o Pandas Loader Multiplo
-             df_fake.to_sql('fila_regulacao', conn, if_exists='append', index=False, method='multi')
+             desativar_commit_sincrono(conn)
+             garantir_tabela_fila(conn)
+             # Carga incremental (sem TRUNCATE): só saem da fila as ocorrências fora da janela,
+             # sem bloquear a tabela para as leituras em andamento.
+             removidos = conn.execute(
+                 text("DELETE FROM fila_regulacao WHERE data_solicitacao < :limite"),
+                 {"limite": (agora - pd.Timedelta(JANELA_DIAS, unit="D")).to_pydatetime()},
+             ).rowcount
+             # Carga em massa via COPY do Postgres; um (paciente, horário) já gravado é mantido
+             inseridos = inserir_sem_duplicatas(df_fake, 'fila_regulacao', CHAVE_FILA, conn)
+             # Reflete a nova fila na view materializada lida pelo Dashboard
+             atualizar_fila_enriquecida(conn)
              
-         logger.info(f"🚀 FEITO! {n_registros} pacientes (Simulação) adicionados com total precisão geográfica no Supabase.")
+         logger.info(f"🚀 FEITO! {inseridos} pacientes (Simulação) adicionados com total precisão geográfica no Supabase.")
+         if removidos:
+             logger.info(f"Removidas {removidos} ocorrências com mais de {JANELA_DIAS} dias da fila de demonstração.")
     except Exception as e:
          logger.error(f"Erro Crítico durante o Envio de pacotes ao Supabase PostgreSQL: {e}")
 
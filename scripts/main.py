@@ -3,24 +3,32 @@
 ETL principal para lista de regulação hospitalar.
 
 Passos:
-- Lê `data/dados_regulacao.csv`
-- Remove duplicatas
+- Lê `data/dados_regulacao.csv` (em lotes, para arquivos grandes)
 - Anonimiza nomes (iniciais)
 - Converte `data_solicitacao` para datetime
-- Insere registros limpos em `fila_regulacao` no Supabase (Postgres) via SQLAlchemy
+- Insere registros limpos em `fila_regulacao` no Supabase (Postgres) via SQLAlchemy,
+  descartando duplicatas pela chave única (id_paciente, data_solicitacao)
 
 Configure seu `.env` com a variável `SUPABASE_DB_URL` antes de rodar.
 """
-import os
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
 import pandas as pd
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 from sqlalchemy.engine import Engine
 
+from scripts.banco import (
+    atualizar_fila_enriquecida,
+    desativar_commit_sincrono,
+    garantir_tabela_fila,
+    inserir_lotes_sem_duplicatas,
+    obter_engine,
+    obter_url_banco,
+)
+
 # --- CONFIGURAÇÃO DE LOGS ---
 logging.basicConfig(
     level=logging.INFO,
@@ -29,6 +37,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger("ETL_Principal")
 
+# Chave natural de uma solicitação na fila (índice único em fila_regulacao)
+CHAVE_FILA = ["id_paciente", "data_solicitacao"]
+
+# Tipos das colunas do CSV de origem, informados já na leitura (sem inferência de tipos).
+# Só essas colunas (e a data) são lidas; as demais do arquivo são ignoradas.
+TIPOS_COLUNAS_CSV = {
+    "id_paciente": "int32",
+    "nome_paciente": "string[pyarrow]",
+    "gravidade": "category",
+    "unidade_origem": "category",
+    "procedimento_solicitado": "string[pyarrow]",
+}
+COLUNAS_DATA_CSV = ["data_solicitacao"]
+
+# Arquivos até este tamanho são lidos de uma vez pelo PyArrow (multithread). Acima dele, o
+# leitor em streaming do PyArrow (`pyarrow.csv.open_csv`) entrega blocos de TAMANHO_BLOCO_CSV
+# bytes: cada bloco é transformado e enviado via COPY antes do próximo, limitando a memória.
+LIMITE_BYTES_LEITURA_UNICA = 64 * 1024 * 1024
+TAMANHO_BLOCO_CSV = 16 * 1024 * 1024
+
+# Tipos Arrow do leitor em streaming, equivalentes a TIPOS_COLUNAS_CSV. O streaming fixa os
+# tipos pelo primeiro bloco, então nada é inferido: a data chega como texto e é convertida
+# em `transformar_lote` (valores inválidos viram NaT em vez de interromper a leitura).
+TIPOS_ARROW_CSV = {
+    "id_paciente": pa.int32(),
+    "nome_paciente": pa.string(),
+    "gravidade": pa.string(),
+    "unidade_origem": pa.string(),
+    "procedimento_solicitado": pa.string(),
+    "data_solicitacao": pa.string(),
+}
+
 
 def anonimizar_nome(nome: Optional[str]) -> Optional[str]:
     """
@@ -47,24 +87,70 @@ def anonimizar_nome(nome: Optional[str]) -> Optional[str]:
     return f"{partes[0][0].upper()}. {partes[-1][0].upper()}."
 
 
-def ajustar_url_sqlalchemy(db_url: str) -> str:
+# Espaços reconhecidos pelo `str.split()` de `anonimizar_nome` (str.isspace), como caracteres
+# literais: o RE2 do PyArrow tem `\s` só para espaços ASCII, e o pandas também compila o padrão no
+# `re` do Python, que não aceita `\p{Z}`. Cobre controles, NBSP e os separadores Unicode.
+_ESPACO = "[ \t-\r\x1c-\x1f\x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]"
+
+
+def anonimizar_nomes(nomes: pd.Series) -> pd.Series:
     """
-    Formata a string de conexão para que o SQLAlchemy utilize o driver psycopg2 corretamente.
+    Versão vetorizada de `anonimizar_nome` para a coluna inteira: as iniciais saem de kernels
+    de texto do PyArrow (dtype "string[pyarrow]"), sem montar uma lista de palavras por linha.
+
+    Divergência conhecida: a maiúscula da inicial segue o PyArrow (um caractere por caractere).
+    Letras cuja maiúscula no Python tem mais de um caractere ('ß' -> 'SS', 'ŉ' -> 'ʼN',
+    'ﬁ' -> 'FI') e letras recentes do Unicode ainda ausentes nas tabelas do PyArrow saem
+    diferentes de `anonimizar_nome`. Os nomes em português (inclusive acentuados) não são afetados.
     """
-    if db_url.startswith("postgres://"):
-        return db_url.replace("postgres://", "postgresql+psycopg2://", 1)
-    if db_url.startswith("postgresql://"):
-        return db_url.replace("postgresql://", "postgresql+psycopg2://", 1)
-    return db_url
+    # O strip() do PyArrow já remove todos esses espaços (Unicode) nas pontas
+    texto = nomes.astype("string[pyarrow]").str.strip()
+    primeira = texto.str.slice(0, 1).str.upper()
+    # Última palavra: remove tudo até o último espaço (`(?s)` para o `.` atravessar quebras de linha)
+    ultima = texto.str.replace(rf"(?s)^.*{_ESPACO}", "", regex=True).str.slice(0, 1).str.upper()
+    nome_composto = texto.str.contains(_ESPACO, na=False)
 
+    iniciais = (primeira + ". " + ultima + ".").where(nome_composto, primeira + ".")
+    iniciais = iniciais.where(texto.str.len().fillna(0) > 0, "")
+    return iniciais.astype(object).where(nomes.notna(), None)
 
-def extrair_e_transformar(caminho_csv: Path) -> pd.DataFrame:
+
+def _ler_blocos_pyarrow(caminho_csv: Path, colunas_lidas: list, tipos: dict) -> Iterator[pd.DataFrame]:
+    """Lê o CSV em streaming com o PyArrow, um bloco de TAMANHO_BLOCO_CSV bytes por vez."""
+    leitor = pa_csv.open_csv(
+        caminho_csv,
+        read_options=pa_csv.ReadOptions(block_size=TAMANHO_BLOCO_CSV),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=colunas_lidas,
+            column_types={col: TIPOS_ARROW_CSV[col] for col in colunas_lidas},
+            strings_can_be_null=True,  # vazios/NA viram nulos, como no read_csv do pandas
+        ),
+    )
+    for bloco in leitor:
+        yield pa.Table.from_batches([bloco]).to_pandas().astype(tipos)
+
+
+def ler_csv_em_lotes(caminho_csv: Path) -> Iterator[pd.DataFrame]:
     """
-    Lê o arquivo CSV, converte tipos de dados, remove duplicatas e anonimiza dados sensíveis (LGPD).
+    Lê o arquivo CSV com tipos e colunas definidos, devolvendo-o em blocos de até
+    TAMANHO_BLOCO_CSV bytes (ou em um único bloco, para arquivos pequenos).
     """
     logger.info(f"Lendo dados brutos do arquivo: {caminho_csv.name}")
     try:
-        df = pd.read_csv(caminho_csv)
+        # O cabeçalho é lido antes porque o PyArrow falha em `usecols`/`include_columns` com
+        # colunas ausentes (ex.: arquivos sem procedimento_solicitado).
+        colunas_arquivo = pd.read_csv(caminho_csv, nrows=0).columns
+        colunas_lidas = [col for col in [*TIPOS_COLUNAS_CSV, *COLUNAS_DATA_CSV] if col in colunas_arquivo]
+        tipos = {col: tipo for col, tipo in TIPOS_COLUNAS_CSV.items() if col in colunas_lidas}
+
+        if caminho_csv.stat().st_size <= LIMITE_BYTES_LEITURA_UNICA:
+            # As datas já são convertidas durante o parse
+            lotes = iter([pd.read_csv(
+                caminho_csv, engine="pyarrow", usecols=colunas_lidas, dtype=tipos, parse_dates=COLUNAS_DATA_CSV
+            )])
+        else:
+            logger.info(f"Arquivo grande: leitura em streaming (PyArrow), em blocos de {TAMANHO_BLOCO_CSV // (1024 * 1024)} MB.")
+            lotes = _ler_blocos_pyarrow(caminho_csv, colunas_lidas, tipos)
     except FileNotFoundError:
         logger.error(f"Arquivo não encontrado: {caminho_csv}")
         raise
@@ -72,24 +158,43 @@ def extrair_e_transformar(caminho_csv: Path) -> pd.DataFrame:
         logger.error(f"Erro ao ler o CSV: {e}")
         raise
 
-    # 1. Converter datas
-    logger.info("Convertendo colunas de data/hora...")
-    df["data_solicitacao"] = pd.to_datetime(df["data_solicitacao"], errors="coerce")
+    # Os blocos seguintes só são lidos durante a carga: erros de parse neles também são
+    # registrados como erro de leitura (e não como falha do COPY).
+    try:
+        yield from lotes
+    except Exception as e:
+        logger.error(f"Erro ao ler o CSV durante a carga em blocos: {e}")
+        raise
+
+
+def transformar_lote(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte tipos de dados e anonimiza dados sensíveis (LGPD) de um lote do CSV.
+    """
+    # 1. Converter datas (só quando o parse não conseguiu, por haver valores inválidos na coluna)
+    if not pd.api.types.is_datetime64_any_dtype(df["data_solicitacao"]):
+        logger.info("Convertendo colunas de data/hora...")
+        df["data_solicitacao"] = pd.to_datetime(df["data_solicitacao"], errors="coerce")
+
+    # 2. Padronizar a classificação de risco (vocabulário controlado: 'Vermelho', 'Laranja'...)
+    # para que o Dashboard compare por igualdade simples, sem regex ou upper() por linha.
+    df["gravidade"] = df["gravidade"].str.strip().str.title()
 
-    # 2. Remover duplicatas exatas
-    total_antes = len(df)
-    df = df.drop_duplicates()
-    total_depois = len(df)
-    if total_antes - total_depois > 0:
-        logger.info(f"Removidas {total_antes - total_depois} linhas duplicatas.")
-    else:
-        logger.info("Nenhuma linha duplicada encontrada.")
+    # 3. Remover repetições da mesma solicitação no lote, pela chave natural (a última linha
+    # do arquivo prevalece), antes da anonimização. Repetições entre lotes seguem a mesma regra
+    # na carga (ordem de chegada no COPY); registros já gravados em cargas anteriores são
+    # mantidos, pela chave única no Postgres.
+    repetidas = df.duplicated(subset=CHAVE_FILA, keep="last")
+    qtd_repetidas = int(repetidas.sum())
+    if qtd_repetidas > 0:
+        df = df.loc[~repetidas].copy()
+        logger.info(f"Descartadas {qtd_repetidas} solicitações repetidas no lote.")
 
-    # 3. Anonimizar nomes (LGPD)
+    # 4. Anonimizar nomes (LGPD)
     logger.info("Aplicando anonimização nos nomes dos pacientes (LGPD)...")
-    df["nome_anonimo"] = df["nome_paciente"].apply(anonimizar_nome)
+    df["nome_anonimo"] = anonimizar_nomes(df["nome_paciente"])
 
-    # 4. Selecionar colunas finais estruturadas para o Banco de Dados
+    # 5. Selecionar colunas finais estruturadas para o Banco de Dados
     colunas_finais = [
         "id_paciente",
         "nome_anonimo",
@@ -103,42 +208,32 @@ def extrair_e_transformar(caminho_csv: Path) -> pd.DataFrame:
     colunas_presentes = [col for col in colunas_finais if col in df.columns]
     df_final = df[colunas_presentes]
     
-    logger.info(f"Transformação concluída. Total de registros prontos: {len(df_final)}")
+    logger.info(f"Transformação do lote concluída. Total de registros prontos: {len(df_final)}")
     return df_final
 
 
-def obter_conexao_banco(db_url: str) -> Engine:
+def extrair_e_transformar(caminho_csv: Path) -> Iterator[pd.DataFrame]:
     """
-    Cria a engine de conexão do SQLAlchemy.
+    Lê o arquivo CSV em lotes e devolve cada lote já transformado, pronto para a carga.
     """
-    url_formatada = ajustar_url_sqlalchemy(db_url)
-    try:
-        engine = create_engine(url_formatada)
-        return engine
-    except Exception as e:
-        logger.error(f"Falha ao criar a engine de conexão com o banco de dados: {e}")
-        raise
+    for lote in ler_csv_em_lotes(caminho_csv):
+        yield transformar_lote(lote)
 
 
-def carregar_no_banco(df: pd.DataFrame, engine: Engine):
-    """
-    Garante a estrutura da tabela no PostgreSQL e insere (append) os dados transformados.
+def obter_conexao_banco(db_url: str) -> Engine:
     """
-    comando_criar_tabela = """
-    CREATE TABLE IF NOT EXISTS public.fila_regulacao (
-        id bigserial PRIMARY KEY,
-        id_paciente integer NOT NULL,
-        nome_anonimo text,
-        gravidade text,
-        procedimento_solicitado text,
-        unidade_origem text,
-        data_solicitacao timestamp without time zone
-    );
+    Obtém a engine de conexão do SQLAlchemy (única por processo, com pool de conexões).
     """
+    return obter_engine(db_url)
 
+
+def carregar_no_banco(lotes: Iterable[pd.DataFrame], engine: Engine):
+    """
+    Garante a estrutura da tabela no PostgreSQL e insere (append) os lotes transformados que ainda não existem.
+    """
     try:
         with engine.begin() as conn:
-            conn.execute(text(comando_criar_tabela))
+            garantir_tabela_fila(conn)
             logger.info("Tabela 'fila_regulacao' verificada/criada com sucesso.")
     except Exception as e:
         logger.error(f"Erro ao verificar/criar a tabela no banco de dados: {e}")
@@ -146,11 +241,24 @@ def carregar_no_banco(df: pd.DataFrame, engine: Engine):
 
     logger.info("Inciando inserção de dados na tabela 'fila_regulacao'...")
     try:
-        # Inserir dados em lotes (multi) para maior performance e appending aos existentes.
-        inseridos = df.to_sql("fila_regulacao", con=engine, if_exists="append", index=False, method="multi")
-        logger.info(f"Sucesso! {len(df)} registros foram inseridos no banco de dados.")
+        # Um COPY por lote para uma tabela temporária + INSERT ... ON CONFLICT DO NOTHING: a
+        # deduplicação (no arquivo e contra cargas anteriores) acontece no próprio Postgres.
+        with engine.begin() as conn:
+            desativar_commit_sincrono(conn)
+            recebidos, inseridos = inserir_lotes_sem_duplicatas(lotes, "fila_regulacao", CHAVE_FILA, conn)
+        logger.info(f"Sucesso! {inseridos} registros foram inseridos no banco de dados.")
+        if recebidos - inseridos > 0:
+            logger.info(f"Ignorados {recebidos - inseridos} registros duplicados ou já existentes na fila.")
+    except Exception as e:
+        logger.error(f"Falha crítica durante a carga dos lotes em 'fila_regulacao': {e}")
+        raise
+
+    try:
+        with engine.begin() as conn:
+            if atualizar_fila_enriquecida(conn):
+                logger.info("View 'fila_enriquecida' do Dashboard atualizada.")
     except Exception as e:
-        logger.error(f"Falha crítica durante a inserção de dados (to_sql): {e}")
+        logger.error(f"Erro ao atualizar a view 'fila_enriquecida': {e}")
         raise
 
 
@@ -160,8 +268,7 @@ def executar_pipeline_etl():
     """
     logger.info("--- Iniciando o Processo ETL Principal ---")
     
-    load_dotenv()
-    db_url = os.environ.get("SUPABASE_DB_URL") or os.environ.get("DATABASE_URL")
+    db_url = obter_url_banco()
     
     if not db_url:
         logger.critical("Variável de ambiente SUPABASE_DB_URL não localizada! Verifique seu arquivo .env.")
@@ -174,14 +281,14 @@ def executar_pipeline_etl():
         return
 
     try:
-        # Puxar e tratar dados do CSV
-        dataframe = extrair_e_transformar(caminho_csv)
+        # Puxar e tratar dados do CSV (lotes lidos sob demanda, durante a carga)
+        lotes = extrair_e_transformar(caminho_csv)
         
         # Iniciar conexão com o DB
         engine = obter_conexao_banco(db_url)
         
         # Enviar (Load) para nuvem/DB Local
-        carregar_no_banco(dataframe, engine)
+        carregar_no_banco(lotes, engine)
         
         logger.info("--- Processo ETL finalizado com Sucesso! ---")
 
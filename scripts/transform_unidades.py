@@ -1,14 +1,18 @@
-import textwrap
+import csv
 import logging
-import os
-import re
 from pathlib import Path
-from typing import Optional, Any
 
 import pandas as pd
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy import Date, text
+
+from scripts.banco import (
+    atualizar_fila_enriquecida,
+    copiar_via_copy,
+    desativar_commit_sincrono,
+    existe_relacao,
+    obter_engine,
+    obter_url_banco,
+)
 
 # --- CONFIGURAÇÃO DE LOGS ---
 logging.basicConfig(
@@ -21,7 +25,7 @@ logger = logging.getLogger("Transform_Unidades")
 # --- 1. Configuração de Caminhos ---
 BASE_DIR: Path = Path(__file__).resolve().parent.parent
 IN_PATH: Path = BASE_DIR / "data" / "raw_unidades.csv"
-OUT_PATH: Path = BASE_DIR / "data" / "unidades_transformed.csv"
+OUT_PATH: Path = BASE_DIR / "data" / "unidades_transformed.parquet"
 
 # Mapeamento: X -> latitude, Y -> longitude
 MAPA_COLUNAS: dict = {
@@ -44,122 +48,178 @@ MAPA_COLUNAS: dict = {
     'CAP': 'cap', 
     'EQUIPES': 'equipes'
 }
+# Colunas lidas do CSV bruto, na ordem do mapeamento (e do layout final do modelo)
+COLUNAS_ORIGEM: tuple = tuple(MAPA_COLUNAS.keys())
+
+# Colunas de texto de baixa cardinalidade: convertidas para `category` (códigos inteiros no
+# lugar de strings repetidas) ao fim do tratamento
+COLUNAS_CATEGORICAS: tuple = ('tipo', 'tipo_abc', 'bairro', 'cap')
 
+# Tipos SQL das colunas quando a carga precisa criar a tabela (data_inauguracao segue como
+# datetime64 no pandas, mas a coluna no banco é DATE, como em estrutura_banco.sql)
+TIPOS_SQL: dict = {'data_inauguracao': Date()}
 
-def para_booleano(valor: Any) -> Optional[bool]:
+# Amostra (bytes) usada para detectar o separador do CSV bruto
+TAMANHO_AMOSTRA_SEPARADOR = 8192
+
+# Representações de verdadeiro/falso aceitas na coluna Ativo (já em minúsculas e sem espaços);
+# qualquer outro valor vira nulo.
+_MAPA_BOOLEANO: dict = {
+    '1': True, '1.0': True, 'true': True, 't': True, 'sim': True, 's': True, 'yes': True, 'y': True,
+    '0': False, '0.0': False, 'false': False, 'f': False, 'nao': False, 'não': False, 'n': False, 'no': False,
+}
+
+
+def detectar_separador(caminho: Path) -> str:
     """
-    Converte diferentes representações de verdadeiro/falso em Booleanos nativos do Python.
+    Detecta o separador do CSV a partir de uma amostra do início do arquivo, para que a
+    leitura completa use o engine C do pandas (o `sep=None` exige o engine Python, bem mais lento).
     """
-    if pd.isna(valor) or str(valor).strip() == '' or str(valor).lower() == 'nan':
-        return None
-    
-    texto = str(valor).strip().lower()
-    
-    if texto in ('1', '1.0', 'true', 't', 'sim', 's', 'yes', 'y'):
-        return True
-    if texto in ('0', '0.0', 'false', 'f', 'nao', 'não', 'n', 'no'):
-        return False
-        
-    return None
+    with open(caminho, 'rb') as arquivo:
+        amostra = arquivo.read(TAMANHO_AMOSTRA_SEPARADOR).decode('utf-8-sig', errors='ignore')
+    try:
+        return csv.Sniffer().sniff(amostra, delimiters=',;\t|').delimiter
+    except csv.Error:
+        logger.warning("Não foi possível detectar o separador do CSV; assumindo vírgula.")
+        return ','
 
 
 def transformar_dados(df: pd.DataFrame) -> pd.DataFrame:
     """
     Executa a higienização dos dados vindos da tabela bruta de unidades de saúde.
     """
+    # Apenas as colunas do MAPA seguem para o tratamento; as demais do CSV bruto são descartadas
+    # antes de qualquer etapa (e o resultado final já sai no layout do modelo).
     logger.info("Aplicando mapeamento de colunas...")
-    df = df.rename(columns=MAPA_COLUNAS)
+    df = df.loc[:, [coluna for coluna in COLUNAS_ORIGEM if coluna in df.columns]].rename(columns=MAPA_COLUNAS)
     
     # Tratamento de Coordenadas (Latitude e Longitude)
     logger.info("Ajustando formato das coordenadas geográficas...")
     for coord in ['latitude', 'longitude']:
         if coord in df.columns:
-            # Substitui vírgula por ponto (caso modelo PT-BR local) e converte para número (float)
-            df[coord] = df[coord].astype(str).str.replace(',', '.')
-            df[coord] = pd.to_numeric(df[coord], errors='coerce')
+            coluna = df[coord]
+            # Só colunas de texto precisam trocar vírgula por ponto (modelo PT-BR local);
+            # colunas já numéricas vão direto para a conversão.
+            if not pd.api.types.is_numeric_dtype(coluna):
+                coluna = coluna.str.replace(',', '.', regex=False)
+            df[coord] = pd.to_numeric(coluna, errors='coerce')
 
     # Tratamento de Datas
     if 'data_inauguracao' in df.columns:
         logger.info("Convertendo colunas de data (Inauguração)...")
+        # Mantida como datetime64 (vetorizado); o Postgres converte para DATE na carga (TIPOS_SQL)
         df['data_inauguracao'] = pd.to_datetime(df['data_inauguracao'], errors='coerce')
-        df['data_inauguracao'] = df['data_inauguracao'].apply(lambda x: x.date() if pd.notnull(x) else None)
 
     # Tratamento Numérico (Correções de ID e Cnes)
     if 'objectid' in df.columns:
-        df['objectid'] = pd.to_numeric(df['objectid'], errors='coerce').astype('Int64')
+        # Int32 (anulável) já corresponde à coluna INTEGER do banco
+        df['objectid'] = pd.to_numeric(df['objectid'], errors='coerce', downcast='integer').astype('Int32')
     
     if 'cnes' in df.columns:
-        df['cnes'] = df['cnes'].astype(str).str.replace(r'\D', '', regex=True)
-        # remove "nan" string se vazou no regexp
-        df.loc[df['cnes'] == 'nan', 'cnes'] = None
+        # Coluna lida como número: Int64 antes do texto evita o sufixo ".0" dos floats.
+        # Coluna de texto: remove toda pontuação ("2.280.167" -> "2280167").
+        # Valores ausentes ou sem dígitos permanecem nulos (<NA>).
+        if pd.api.types.is_numeric_dtype(df['cnes']):
+            df['cnes'] = df['cnes'].astype('Int64').astype('string')
+        else:
+            df['cnes'] = df['cnes'].astype('string').str.replace(r'\D', '', regex=True).replace('', pd.NA)
+
+    # Tratamento da CAP: normalizada uma única vez na carga ('N/I' quando não informada),
+    # assim o Dashboard não precisa tratar valores nulos a cada consulta.
+    if 'cap' in df.columns:
+        df['cap'] = df['cap'].astype('string').str.strip().replace('', pd.NA).fillna('N/I')
 
     # Tratamento Booleano
     if 'ativo' in df.columns:
         logger.info("Padronizando a coluna Ativo/Inativo...")
-        df['ativo'] = df['ativo'].apply(para_booleano)
+        df['ativo'] = df['ativo'].astype('string').str.strip().str.lower().map(_MAPA_BOOLEANO).astype('boolean')
 
     # Limpeza Geral de Texto (Padronização para facilitar visualização no Dashboard)
-    df['nome_unidade'] = df['nome_unidade'].astype(str).str.title()
-    df['municipio'] = 'Rio de Janeiro'
+    # O title() roda só sobre os nomes distintos (categorias), e nomes ausentes continuam nulos
+    # para a validação abaixo. (O município não é enviado: a coluna tem DEFAULT 'Rio de Janeiro' no banco.)
+    nomes = df['nome_unidade'].astype('string').str.strip().replace('', pd.NA).astype('category')
+    titulos = dict(zip(nomes.cat.categories, nomes.cat.categories.str.title()))
+    df['nome_unidade'] = nomes.map(titulos, na_action='ignore').astype('string')
     
     # Validação fundamental:
     # 1. Remover unidades sem Nome.
-    # 2. Retornar apenas as colunas válidas (que estão no MAPA) para o modelo.
-    linhas_antes = len(df)
-    df = df.dropna(subset=['nome_unidade'])
-    logger.info(f"Omitidas {linhas_antes - len(df)} linhas invalidas por ausência do Nome da Unidade.")
-    
-    colunas_validas = [valor for valor in MAPA_COLUNAS.values() if valor in df.columns]
+    # 2. Manter um único cadastro por Nome (chave do JOIN com a fila de regulação).
+    # As máscaras já fornecem a contagem de linhas descartadas em cada etapa.
+    com_nome = df['nome_unidade'].notna()
+    df = df.loc[com_nome]
+    logger.info(f"Omitidas {int((~com_nome).sum())} linhas invalidas por ausência do Nome da Unidade.")
+
+    repetidos = df.duplicated(subset=['nome_unidade'], keep='first')
+    qtd_repetidos = int(repetidos.sum())
+    if qtd_repetidos > 0:
+        df = df.loc[~repetidos]
+        logger.info(f"Descartados {qtd_repetidos} cadastros repetidos para o mesmo Nome de Unidade.")
+
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype('category')
     
     logger.info("Transformação nos dados Concluída com sucesso!")
-    return df[colunas_validas]
-
-
-def garantir_url_banco(db_url: str) -> str:
-    """Verifica e adapta o sufixo postgres->postgresql."""
-    if db_url.startswith('postgres://'):
-        return db_url.replace('postgres://', 'postgresql+psycopg2://', 1)
-    if db_url.startswith('postgresql://'):
-         return db_url.replace('postgresql://', 'postgresql+psycopg2://', 1)
-    return db_url
+    return df
 
 
 def carregar_dados_no_banco(df: pd.DataFrame, nome_tabela: str = 'unidades_saude') -> None:
     """
     Carrega o DataFrame consolidado no Supabase/PostgreSQL sobrescrevendo a tabela anterior (TRUNCATE).
     """
-    load_dotenv()
-    db_url = os.getenv('SUPABASE_DB_URL') or os.getenv("DATABASE_URL")
+    db_url = obter_url_banco()
     
     if not db_url:
         logger.error("A URL do Banco (SUPABASE_DB_URL) não foi localizada no .env.")
         raise ValueError("Configuração Inválida.")
 
-    url_formatada = garantir_url_banco(db_url)
-    try:
-        engine = create_engine(url_formatada)
-    except Exception as e:
-        logger.critical(f"Falha na criação da conexão SQLAlchemy: {e}")
-        raise
-
-    # Como são dados mestre (Master Data) muitas vezes sobrescrevemos na carga
-    logger.info(f"Iniciando Truncate/Limpeza na tabela '{nome_tabela}'...")
-    try:
-         with engine.begin() as conn:
-            conn.execute(text(f"TRUNCATE TABLE {nome_tabela} RESTART IDENTITY CASCADE;"))
-    except Exception as e:
-         logger.warning(f"Ocorreu um aviso durante a execução do TRUNCATE. Possivelmente a tabela não existia: {e}")
+    # Engine única por processo (pool com pre-ping), compartilhada com os demais scripts
+    engine = obter_engine(db_url)
 
-    logger.info(f"Inserindo novos os {len(df)} registros atualizados...")
+    # Como são dados mestre (Master Data) muitas vezes sobrescrevemos na carga.
+    # TRUNCATE e COPY na mesma transação: se a carga falhar, o cadastro anterior é preservado.
+    logger.info(f"Iniciando Truncate/Limpeza e inserção dos {len(df)} registros atualizados em '{nome_tabela}'...")
     
     try:
-        # Inserção direta utilizando To_Sql
-        df.to_sql(nome_tabela, con=engine, if_exists='append', index=False, method='multi')
+        with engine.begin() as conn:
+            desativar_commit_sincrono(conn)
+            if existe_relacao(conn, nome_tabela):
+                conn.execute(text(f"TRUNCATE TABLE {nome_tabela} RESTART IDENTITY CASCADE;"))
+            else:
+                logger.warning(f"A tabela '{nome_tabela}' ainda não existia e será criada pela carga.")
+            # To_Sql com COPY ... FROM STDIN (bem mais rápido que INSERTs com múltiplos VALUES)
+            tipos_sql = {coluna: tipo for coluna, tipo in TIPOS_SQL.items() if coluna in df.columns}
+            df.to_sql(nome_tabela, con=conn, if_exists='append', index=False, method=copiar_via_copy, dtype=tipos_sql)
         logger.info(f"🚀 SUCESSO! Carga finalizada com {len(df)} registros integrados nativamente.")
     except Exception as erro_carga:
         logger.error(f"⚠️ Erro Crítico durante a injeção do To_Sql: {erro_carga}")
         raise
 
+    # Estrutura esperada pelo Dashboard:
+    # - Índices das chaves usadas nas consultas (JOIN por nome e filtro por CAP). O UNIQUE em
+    #   nome_unidade informa ao planner que o JOIN com a fila é 1:N.
+    # - CAP sempre preenchida ('N/I' por padrão), migrando registros antigos ainda nulos.
+    comando_estrutura = f"""
+    CREATE UNIQUE INDEX IF NOT EXISTS {nome_tabela}_nome_unidade_key ON {nome_tabela} (nome_unidade);
+    CREATE INDEX IF NOT EXISTS ix_{nome_tabela}_cap ON {nome_tabela} (cap);
+    UPDATE {nome_tabela} SET cap = 'N/I' WHERE cap IS NULL;
+    ALTER TABLE {nome_tabela} ALTER COLUMN cap SET DEFAULT 'N/I', ALTER COLUMN cap SET NOT NULL;
+    """
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(comando_estrutura))
+        logger.info(f"Índices e colunas da tabela '{nome_tabela}' verificados com sucesso.")
+    except Exception as e:
+        logger.warning(f"Não foi possível garantir a estrutura da tabela '{nome_tabela}': {e}")
+
+    # A fila já carregada passa a enxergar a CAP/coordenadas novas (apenas se a view já existir)
+    try:
+        with engine.begin() as conn:
+            if atualizar_fila_enriquecida(conn, criar=False):
+                logger.info("View 'fila_enriquecida' do Dashboard atualizada com as novas unidades.")
+    except Exception as e:
+        logger.warning(f"Não foi possível atualizar a view 'fila_enriquecida': {e}")
+
 
 def iniciar_fluxo_unidades():
     """Script Mestre que carrega da Origem, Trata e Envia ao Destino."""
@@ -171,7 +231,9 @@ def iniciar_fluxo_unidades():
     
     logger.info("Realizando Leitura Inicial de Dados (Raw CSV)...")
     try:
-        df_bruto = pd.read_csv(IN_PATH, sep=None, engine='python', on_bad_lines='skip', encoding='utf-8-sig')
+        separador = detectar_separador(IN_PATH)
+        logger.info(f"Separador detectado no CSV bruto: {separador!r}")
+        df_bruto = pd.read_csv(IN_PATH, sep=separador, engine='c', on_bad_lines='skip', encoding='utf-8-sig')
     except Exception as e:
          logger.error(f"Falha na leitura do arquivo pandas: {e}")
          return
@@ -179,9 +241,9 @@ def iniciar_fluxo_unidades():
     # Transformar para o layout limpo (Ouro)
     df_limpo = transformar_dados(df_bruto)
     
-    # Backup local
-    df_limpo.to_csv(OUT_PATH, index=False)
-    logger.info(f"Cópia de segurança salva em formato CSV: {OUT_PATH}")
+    # Backup local (Parquet colunar e comprimido: mais rápido de gravar que CSV e preserva os tipos)
+    df_limpo.to_parquet(OUT_PATH, engine='pyarrow', compression='zstd', index=False)
+    logger.info(f"Cópia de segurança salva em formato Parquet: {OUT_PATH}")
     
     try:
         carregar_dados_no_banco(df_limpo)